@@ -0,0 +1,86 @@
+import os
+import cv2
+import json
+import time
+import base64
+import argparse
+import tempfile
+import threading
+import numpy as np
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+
+def make_test_chart(width=1920, height=1080, angle=5.0):
+    yy, xx = np.mgrid[0:height, 0:width]
+    theta = np.deg2rad(angle)
+    chart = np.where((yy - height / 2) * np.cos(theta) - (xx - width / 2) * np.sin(theta) > 0, 200, 40)
+    chart = cv2.GaussianBlur(chart.astype(np.uint8), (0, 0), 1.5)
+    return cv2.cvtColor(chart, cv2.COLOR_GRAY2BGR)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return float(np.percentile(values, pct))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for MTFTestInterface.py --serve")
+    parser.add_argument("--url", default="http://127.0.0.1:8765/measure")
+    parser.add_argument("--image", help="chart image to send; a synthetic slanted edge is used if omitted")
+    parser.add_argument("--inline", action="store_true", help="send the image base64-encoded instead of by path")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    image_path = args.image
+    if image_path is None:
+        image_path = os.path.join(tempfile.gettempdir(), "mtf_loadtest_chart.png")
+        cv2.imwrite(image_path, make_test_chart())
+    height, width = cv2.imread(image_path).shape[:2]
+    rois = [[width // 2 - 64 + dx, height // 2 - 64, width // 2 + 64 + dx, height // 2 + 64] for dx in (-400, -200, 200, 400, 0)]
+    payload = {'rois': rois}
+    if args.inline:
+        with open(image_path, 'rb') as f:
+            payload['image'] = base64.b64encode(f.read()).decode()
+    else:
+        payload['image_path'] = os.path.abspath(image_path)
+    body = json.dumps(payload).encode()
+
+    latencies = []
+    status_counts = {}
+    lock = threading.Lock()
+
+    def send_one(_):
+        request = urllib.request.Request(args.url, data=body, headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, ConnectionError):
+            status = "error"
+        elapsed = time.perf_counter() - start
+        with lock:
+            status_counts[status] = status_counts.get(status, 0) + 1
+            if status == 200:
+                latencies.append(elapsed * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(send_one, range(args.requests)))
+    total = time.perf_counter() - start
+
+    print(f"Requests: {args.requests}, clients: {args.clients}, wall time: {total:.2f} s")
+    print(f"Throughput: {status_counts.get(200, 0) / total:.1f} req/s (successful)")
+    print(f"Status codes: {status_counts}")
+    print(f"Latency ms: p50={percentile(latencies, 50):.1f} p95={percentile(latencies, 95):.1f} "
+          f"p99={percentile(latencies, 99):.1f} max={max(latencies, default=0):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,13 +16,156 @@ from multiprocessing import Queue, set_start_method, freeze_support
 import xml.etree.ElementTree as ET
 import pandas as pd
 import json
+import queue
+import base64
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from cryptography.fernet import Fernet
 
+ANGLES = ['0°', '45° - Face 1', '45° - Face 2', '45° - Face 3', '45° - Face 4']
+CENTER_ROI_LABEL = "ROI_C"
+CONFIG_ENCRYPTION_KEY = b'hdxFB4TaFhrav_-CX7KpomCAWJ2T6eEby2Q_9FzHn7g='
+
+
+def read_config(config_file):
+    """Decrypt and return the threshold config, or None when the file does not exist yet."""
+    if not os.path.exists(config_file):
+        return None
+    with open(config_file, 'r') as f:
+        config = json.loads(Fernet(CONFIG_ENCRYPTION_KEY).decrypt(f.read().encode()).decode())
+    config.setdefault('mtf_threshold_center', 0.5)
+    config.setdefault('mtf_threshold_surround', 0.5)
+    config.setdefault('mtf_delta_threshold', 0.1)
+    return config
+
+
+def make_grid_template(rows, cols, margin=0.15):
+    """Return (label, fx, fy) fields for a rows x cols grid in normalized frame coordinates."""
+    fields = []
+    for r in range(rows):
+        for c in range(cols):
+            fx = margin + (1 - 2 * margin) * c / (cols - 1) if cols > 1 else 0.5
+            fy = margin + (1 - 2 * margin) * r / (rows - 1) if rows > 1 else 0.5
+            is_center = rows % 2 == 1 and cols % 2 == 1 and r == rows // 2 and c == cols // 2
+            fields.append(("C" if is_center else f"R{r}C{c}", fx, fy))
+    return fields
+
+
+ROI_GRID_TEMPLATES = {
+    "5-field": [("UL", 0.15, 0.15), ("UR", 0.85, 0.15), ("LL", 0.15, 0.85), ("LR", 0.85, 0.85), ("C", 0.5, 0.5)],
+    "9-field (3x3)": make_grid_template(3, 3),
+    "15-field (3x5)": make_grid_template(3, 5),
+    "25-field (5x5)": make_grid_template(5, 5),
+}
+
+
+def template_corner_labels(template):
+    """Return the ROI labels of the four outermost corner fields of a template."""
+    xs = [fx for _, fx, _ in template]
+    ys = [fy for _, _, fy in template]
+    return {f"ROI_{label}" for label, fx, fy in template
+            if fx in (min(xs), max(xs)) and fy in (min(ys), max(ys)) and f"ROI_{label}" != CENTER_ROI_LABEL}
+
+
+def template_grid_pitch(template):
+    """Return the smallest normalized spacing between field columns and between field rows."""
+    pitches = []
+    for positions in ([fx for _, fx, _ in template], [fy for _, _, fy in template]):
+        positions = np.unique(positions)
+        pitches.append(float(np.diff(positions).min()) if len(positions) > 1 else 0.5)
+    return tuple(pitches)
+
+
+def evaluate_mtf_results(labels, mtf_values, center_threshold, surround_threshold, delta_threshold, corner_labels=None):
+    """Apply the center/corner/diff thresholds to one set of per-field MTF50 values.
+
+    The corner diff is taken over corner_labels only (the four template corners),
+    or over every non-center field when no corner set is given. The result is
+    Fail when the center field or any of corner_labels was not measured.
+    """
+    mtf_values = np.asarray(mtf_values, dtype=float)
+    missing = sorted(({CENTER_ROI_LABEL} | set(corner_labels or ())) - set(labels))
+    is_center = np.array([label == CENTER_ROI_LABEL for label in labels], dtype=bool)
+    field_pass = np.where(is_center, mtf_values >= center_threshold, mtf_values >= surround_threshold)
+    if corner_labels is None:
+        corners = mtf_values[~is_center]
+    else:
+        corners = mtf_values[np.array([label in corner_labels for label in labels], dtype=bool)]
+    corner_diff = float(corners.max() - corners.min()) if corners.size else 0.0
+    delta_pass = corner_diff <= delta_threshold and not set(corner_labels or ()) - set(labels)
+    overall_status = "Pass" if not missing and field_pass.all() and delta_pass else "Fail"
+    return {
+        'missing': missing,
+        'field_pass': field_pass,
+        'corner_diff': corner_diff,
+        'delta_pass': delta_pass,
+        'result': overall_status,
+    }
+
+
+UIUpdate = namedtuple('UIUpdate', ['target', 'payload'])
+
+
+class UIDispatcher:
+    """Applies widget updates posted from any thread on the Tk main loop.
+
+    Workers post immutable UIUpdate messages; every interval_ms the queue is
+    drained, updates for the same target are coalesced so only the latest one
+    is applied, and the batch is applied in one pass.
+    """
+
+    def __init__(self, master, interval_ms=50, max_batch=500):
+        self.master = master
+        self.interval_ms = interval_ms
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.handlers = {}
+
+    def register(self, target, handler):
+        self.handlers[target] = handler
+
+    def register_widget(self, target, widget):
+        self.register(target, lambda options: widget.config(**dict(options)))
+
+    def post(self, target, payload):
+        self.queue.put(UIUpdate(target, payload))
+
+    def post_config(self, target, **options):
+        self.post(target, tuple(sorted(options.items())))
+
+    def start(self):
+        self.master.after(self.interval_ms, self._drain)
+
+    def _drain(self):
+        pending = {}
+        for _ in range(self.max_batch):
+            try:
+                update = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            pending[update.target] = update.payload
+        for target, payload in pending.items():
+            try:
+                self.handlers[target](payload)
+            except Exception as e:
+                print(f"UI update for {target} failed: {e}")
+        self.master.after(self.interval_ms, self._drain)
+
+
 class MTFApplication:
+    FIELD_MAP_SIZE = (160, 90)
+
     def __init__(self, master):
         self.master = master
         self.roi_list = []
         self.current_roi = None
+        self.roi_template_var = tk.StringVar(value="5-field")
+        # Plain copy of the template labels for the OpenCV mouse callback, which runs off the Tk thread.
+        self.roi_field_labels = [label for label, _, _ in ROI_GRID_TEMPLATES[self.roi_template_var.get()]]
+        self.roi_size_ratio = 0.08
+        self.orientation_mode_var = tk.BooleanVar(value=False)
         self.device_var = tk.StringVar(value="SPD-T5390")
         self.rtsp_url = None
         self.current_frame = None
@@ -31,13 +174,21 @@ class MTFApplication:
         self.mtf_threshold_center = 0.5
         self.mtf_threshold_surround = 0.5
         self.mtf_delta_threshold = 0.1
-        self.mtf_results = [[] for _ in range(5)]
+        self.mtf_results = [None] * 5
+        self.running_tests = set()
+        self.evidence_archiver = EvidenceArchiver('evidence', max_bytes=2 * 1024 ** 3)
+        self.frame_gate = FrameQualityGate()
+        self.frame_gate_timeout = 3.0
+        self.frame_gate_enabled = True
         self.engineer_mode = False
         self.config_file = 'config.json'
-        self.encryption_key = b'hdxFB4TaFhrav_-CX7KpomCAWJ2T6eEby2Q_9FzHn7g='
+        self.encryption_key = CONFIG_ENCRYPTION_KEY
         self.fernet = Fernet(self.encryption_key)
         self.load_thresholds()
+        self.ui_dispatcher = UIDispatcher(master)
         self.setup_ui()
+        self.register_ui_targets()
+        self.ui_dispatcher.start()
         self.disable_controls()
 
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -49,14 +200,17 @@ class MTFApplication:
         return self.fernet.decrypt(data.encode()).decode()
 
     def load_thresholds(self):
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r') as f:
-                encrypted_data = f.read()
-                decrypted_data = self.decrypt(encrypted_data)
-                config = json.loads(decrypted_data)
-                self.mtf_threshold_center = config.get('mtf_threshold_center', 0.5)
-                self.mtf_threshold_surround = config.get('mtf_threshold_surround', 0.5)
-                self.mtf_delta_threshold = config.get('mtf_delta_threshold', 0.1)
+        config = read_config(self.config_file)
+        if config is not None:
+            self.mtf_threshold_center = config['mtf_threshold_center']
+            self.mtf_threshold_surround = config['mtf_threshold_surround']
+            self.mtf_delta_threshold = config['mtf_delta_threshold']
+            self.frame_gate.min_edge_sharpness = config.get('gate_min_edge_sharpness', self.frame_gate.min_edge_sharpness)
+            self.frame_gate.min_contrast = config.get('gate_min_contrast', self.frame_gate.min_contrast)
+            self.frame_gate.max_frame_diff = config.get('gate_max_frame_diff', self.frame_gate.max_frame_diff)
+            self.frame_gate.max_clipped_ratio = config.get('gate_max_clipped_ratio', self.frame_gate.max_clipped_ratio)
+            self.frame_gate_timeout = config.get('gate_timeout', self.frame_gate_timeout)
+            self.frame_gate_enabled = config.get('gate_enabled', self.frame_gate_enabled)
         else:
             self.save_thresholds()
 
@@ -64,7 +218,13 @@ class MTFApplication:
         config = {
             'mtf_threshold_center': self.mtf_threshold_center,
             'mtf_threshold_surround': self.mtf_threshold_surround,
-            'mtf_delta_threshold': self.mtf_delta_threshold
+            'mtf_delta_threshold': self.mtf_delta_threshold,
+            'gate_min_edge_sharpness': self.frame_gate.min_edge_sharpness,
+            'gate_min_contrast': self.frame_gate.min_contrast,
+            'gate_max_frame_diff': self.frame_gate.max_frame_diff,
+            'gate_max_clipped_ratio': self.frame_gate.max_clipped_ratio,
+            'gate_timeout': self.frame_gate_timeout,
+            'gate_enabled': self.frame_gate_enabled
         }
         encrypted_data = self.encrypt(json.dumps(config))
         with open(self.config_file, 'w') as f:
@@ -94,6 +254,13 @@ class MTFApplication:
         self.roi_listbox_label = ttk.Label(self.master, text="Selected ROIs:")
         self.roi_listbox = tk.Listbox(self.master, height=5)
         self.clear_button = ttk.Button(self.master, text="Clear ROIs", command=self.clear_rois)
+        self.roi_template_label = ttk.Label(self.master, text="ROI Template:")
+        self.roi_template_combobox = ttk.Combobox(self.master, textvariable=self.roi_template_var, state='readonly')
+        self.roi_template_combobox['values'] = tuple(ROI_GRID_TEMPLATES)
+        self.roi_template_combobox.bind("<<ComboboxSelected>>", self.on_roi_template_selected)
+        self.apply_template_button = ttk.Button(self.master, text="Apply Grid", command=self.apply_roi_template)
+        self.orientation_mode_checkbutton = ttk.Checkbutton(self.master, text="Sagittal/Tangential", variable=self.orientation_mode_var)
+        self.frame_gate_label = ttk.Label(self.master, text="Rejected frames: 0")
         self.threshold_label_center = ttk.Label(self.master, text="Center Threshold:")
         self.threshold_entry_center = ttk.Entry(self.master)
         self.threshold_entry_center.insert(0, str(self.mtf_threshold_center))
@@ -106,6 +273,21 @@ class MTFApplication:
         self.threshold_entry_delta = ttk.Entry(self.master)
         self.threshold_entry_delta.insert(0, str(self.mtf_delta_threshold))
         self.threshold_entry_delta.config(state='disabled')
+        self.frame_gate_enabled_var = tk.BooleanVar(value=self.frame_gate_enabled)
+        self.frame_gate_checkbutton = ttk.Checkbutton(self.master, text="Frame Quality Gate", variable=self.frame_gate_enabled_var, state='disabled')
+        self.gate_entries = []
+        gate_fields = [
+            ("Min Edge Sharpness:", self.frame_gate.min_edge_sharpness),
+            ("Min Edge Contrast:", self.frame_gate.min_contrast),
+            ("Max Frame Diff:", self.frame_gate.max_frame_diff),
+            ("Max Clipped Ratio:", self.frame_gate.max_clipped_ratio),
+            ("Gate Timeout (s):", self.frame_gate_timeout),
+        ]
+        for text, value in gate_fields:
+            entry = ttk.Entry(self.master, width=8)
+            entry.insert(0, str(value))
+            entry.config(state='disabled')
+            self.gate_entries.append((ttk.Label(self.master, text=text), entry))
         self.capture_button = ttk.Button(self.master, text="Capture Screenshot", command=self.capture_screenshot)
         self.export_button = ttk.Button(self.master, text="Export Excel", command=self.export_to_excel)
         self.wide_end_button = ttk.Button(self.master, text="Wide end", command=self.on_wide_end)
@@ -113,13 +295,11 @@ class MTFApplication:
         self.tele_end_button = ttk.Button(self.master, text="Tele end", command=self.on_tele_end)
         self.autofocus_button = ttk.Button(self.master, text="Auto focus", command=self.on_autofocus)
         self.camera_status_label = ttk.Label(self.master, text="Camera status: unknown")
-        angles = ['0°', '45° - Face 1', '45° - Face 2', '45° - Face 3', '45° - Face 4']
-        self.roi_mtf_labels = []
+        self.field_map_canvases = []
         self.roi_diff_labels = []
         self.roi_status_labels = []
         self.test_counter_labels = []
-        roi_labels = ["MTF_UL", "MTF_UR", "MTF_LL", "MTF_LR", "MTF_C"]
-        for idx, angle in enumerate(angles):
+        for idx, angle in enumerate(ANGLES):
             angle_label = ttk.Label(self.master, text=angle)
             angle_label.grid(column=0, row=12 + idx, padx=5, pady=5, sticky='w')
             test_button = ttk.Button(self.master, text="Test", command=lambda idx=idx: self.calculate_mtfs(idx))
@@ -127,16 +307,13 @@ class MTFApplication:
             test_counter_label = ttk.Label(self.master, text=f"Count: {self.test_counters[idx]}")
             test_counter_label.grid(column=2, row=12 + idx, padx=5, pady=5, sticky='w')
             self.test_counter_labels.append(test_counter_label)
-            mtf_labels = []
             diff_label = ttk.Label(self.master, text="Diff=")
             status_label = ttk.Label(self.master, text="Status:")
-            for roi_idx in range(5):
-                mtf_label = ttk.Label(self.master, text=f'{roi_labels[roi_idx]}=')
-                mtf_label.grid(column=3 + roi_idx * 2, row=12 + idx, padx=5, pady=5, sticky='e')
-                mtf_labels.append(mtf_label)
+            field_map_canvas = tk.Canvas(self.master, width=self.FIELD_MAP_SIZE[0], height=self.FIELD_MAP_SIZE[1], background="gray20", highlightthickness=0)
+            field_map_canvas.grid(column=3, row=12 + idx, columnspan=10, padx=5, pady=2, sticky='w')
             diff_label.grid(column=13, row=12 + idx, padx=5, pady=5, sticky='w')
             status_label.grid(column=14, row=12 + idx, padx=5, pady=5, sticky='w')
-            self.roi_mtf_labels.append(mtf_labels)
+            self.field_map_canvases.append(field_map_canvas)
             self.roi_diff_labels.append(diff_label)
             self.roi_status_labels.append(status_label)
 
@@ -160,6 +337,11 @@ class MTFApplication:
         self.tele_end_button.grid(row=6, column=0, padx=5, pady=5, sticky='w')
         self.autofocus_button.grid(row=6, column=1, padx=5, pady=5, sticky='w')
         self.capture_button.grid(row=6, column=2, columnspan=2, padx=5, pady=5, sticky='w')
+        self.roi_template_label.grid(row=7, column=0, sticky='w')
+        self.roi_template_combobox.grid(row=7, column=1, padx=5, pady=5, sticky='w')
+        self.apply_template_button.grid(row=7, column=2, padx=5, pady=5, sticky='w')
+        self.orientation_mode_checkbutton.grid(row=8, column=0, columnspan=2, padx=5, pady=5, sticky='w')
+        self.frame_gate_label.grid(row=8, column=2, columnspan=2, padx=5, pady=5, sticky='w')
         self.roi_listbox_label.grid(row=10, column=0, sticky='w')
         self.roi_listbox.grid(row=10, column=1, padx=5, pady=5, sticky='w')
         self.clear_button.grid(row=11, column=0, sticky='w')
@@ -169,6 +351,10 @@ class MTFApplication:
         self.threshold_entry_surround.grid(row=10, column=3, padx=5, pady=5, sticky='w')
         self.threshold_label_delta.grid(row=11, column=2, padx=5, pady=5, sticky='w')
         self.threshold_entry_delta.grid(row=11, column=3, padx=5, pady=5, sticky='w')
+        self.frame_gate_checkbutton.grid(row=6, column=4, columnspan=2, padx=5, pady=5, sticky='w')
+        for row, (label, entry) in enumerate(self.gate_entries, start=7):
+            label.grid(row=row, column=4, padx=5, pady=5, sticky='w')
+            entry.grid(row=row, column=5, padx=5, pady=5, sticky='w')
         self.export_button.grid(row=17, column=13, padx=5, pady=5, sticky='w')
         self.camera_status_label.grid(row=9, column=0, columnspan=2, padx=5, pady=5, sticky='w')
         self.roi_listbox.bind("<Double-1>", self.edit_roi)
@@ -176,6 +362,16 @@ class MTFApplication:
     def bind_canvas_events(self):
         pass
 
+    def register_ui_targets(self):
+        self.ui_dispatcher.register_widget('camera_status', self.camera_status_label)
+        self.ui_dispatcher.register_widget('frame_gate', self.frame_gate_label)
+        self.ui_dispatcher.register('roi_listbox', self.refresh_roi_listbox)
+        for idx in range(len(ANGLES)):
+            self.ui_dispatcher.register_widget(f'counter_{idx}', self.test_counter_labels[idx])
+            self.ui_dispatcher.register_widget(f'diff_{idx}', self.roi_diff_labels[idx])
+            self.ui_dispatcher.register_widget(f'status_{idx}', self.roi_status_labels[idx])
+            self.ui_dispatcher.register(f'field_map_{idx}', lambda fields, idx=idx: self.draw_field_map(idx, fields))
+
     def on_start(self):
         ip = self.ip_entry.get()
         username = self.username_entry.get()
@@ -192,22 +388,18 @@ class MTFApplication:
                 self.status_label.config(text="Invalid credentials", foreground="red")
                 return
             self.status_label.config(text="Connected", foreground="green")
-            self.start_opencv_stream(self.rtsp_url)
+            self.start_opencv_stream(self.rtsp_url, ip, username, password)
             self.enable_controls()
             self.monitor_camera_status(ip, username, password)
         except subprocess.TimeoutExpired:
             self.status_label.config(text="Connection timed out", foreground="red")
 
-    def start_opencv_stream(self, rtsp_url):
-        self.stream_thread = threading.Thread(target=self.display_opencv_stream, args=(rtsp_url,))
+    def start_opencv_stream(self, rtsp_url, ip, username, password):
+        self.stream_thread = threading.Thread(target=self.display_opencv_stream, args=(rtsp_url, ip, username, password))
         self.stream_thread.daemon = True
         self.stream_thread.start()
 
-    def display_opencv_stream(self, rtsp_url):
-        ip = self.ip_entry.get()
-        username = self.username_entry.get()
-        password = self.password_entry.get()
-        
+    def display_opencv_stream(self, rtsp_url, ip, username, password):
         curl_command = [
             'curl', '--cookie', 'ipcamera=test', '--digest', '-u', f'{username}:{password}',
             f'http://{ip}/cgi-bin/get?encode.profile.1.config'
@@ -256,9 +448,7 @@ class MTFApplication:
         cap.release()
         cv2.destroyAllWindows()
 
-        self.stream_thread = threading.Thread(target=self.display_opencv_stream, args=(rtsp_url,))
-        self.stream_thread.daemon = True
-        self.stream_thread.start()
+        self.start_opencv_stream(rtsp_url, ip, username, password)
 
     def display_opencv_stream_fixed_resolution(self, rtsp_url):
         fixed_width, fixed_height = self.stream_resolution
@@ -288,7 +478,7 @@ class MTFApplication:
 
     def on_opencv_mouse_event(self, event, x, y, flags, param):
         if event == cv2.EVENT_LBUTTONDOWN:
-            if len(self.roi_list) < 5:
+            if len(self.roi_list) < len(self.roi_field_labels):
                 scale_x = self.stream_resolution[0] / 1920
                 scale_y = self.stream_resolution[1] / 1080
                 self.current_roi = [int(x * scale_x), int(y * scale_y), int(x * scale_x), int(y * scale_y)]
@@ -299,16 +489,36 @@ class MTFApplication:
             self.current_roi[3] = int(y * scale_y)
         elif event == cv2.EVENT_LBUTTONUP:
             if self.current_roi is not None:
-                roi_positions = ["UL", "UR", "LL", "LR", "C"]
-                roi_label = f"ROI_{roi_positions[len(self.roi_list)]}"
+                roi_label = f"ROI_{self.roi_field_labels[len(self.roi_list)]}"
                 self.roi_list.append((tuple(self.current_roi), roi_label))
                 self.update_roi_listbox()
                 self.current_roi = None
 
+    def on_roi_template_selected(self, event=None):
+        self.roi_field_labels = [label for label, _, _ in ROI_GRID_TEMPLATES[self.roi_template_var.get()]]
+        self.clear_rois()
+
+    def apply_roi_template(self):
+        if self.stream_resolution is None:
+            print("Stream resolution unknown, cannot place ROI grid.")
+            return
+        width, height = self.stream_resolution
+        half_size = int(width * self.roi_size_ratio / 2)
+        self.roi_list = []
+        for label, fx, fy in ROI_GRID_TEMPLATES[self.roi_template_var.get()]:
+            cx, cy = int(fx * width), int(fy * height)
+            roi = (max(cx - half_size, 0), max(cy - half_size, 0), min(cx + half_size, width), min(cy + half_size, height))
+            self.roi_list.append((roi, f"ROI_{label}"))
+        self.update_roi_listbox()
+
     def update_roi_listbox(self):
+        # Also called from the OpenCV mouse callback, so the listbox itself is only touched by the dispatcher.
+        self.ui_dispatcher.post('roi_listbox', tuple(f"{label}: {roi}" for roi, label in self.roi_list))
+
+    def refresh_roi_listbox(self, items):
         self.roi_listbox.delete(0, tk.END)
-        for i, (roi, label) in enumerate(self.roi_list):
-            self.roi_listbox.insert(tk.END, f"{label}: {roi}")
+        for item in items:
+            self.roi_listbox.insert(tk.END, item)
 
     def clear_rois(self):
         self.roi_list = []
@@ -374,7 +584,7 @@ class MTFApplication:
             while True:
                 status = self.monitor_status(ip, username, password)
                 if status:
-                    self.camera_status_label.config(text=f"Camera status: {status}")
+                    self.ui_dispatcher.post_config('camera_status', text=f"Camera status: {status}")
                 time.sleep(5)
         threading.Thread(target=update_status, daemon=True).start()
 
@@ -540,36 +750,112 @@ class MTFApplication:
         except Exception as e:
             print(f"Error executing curl command: {e}")
 
+    def read_gate_entries(self):
+        values = [float(entry.get()) for _, entry in self.gate_entries]
+        self.frame_gate.min_edge_sharpness, self.frame_gate.min_contrast, self.frame_gate.max_frame_diff, self.frame_gate.max_clipped_ratio, self.frame_gate_timeout = values
+        self.frame_gate_enabled = self.frame_gate_enabled_var.get()
+
     def calculate_mtfs(self, label_idx):
         self.mtf_threshold_center = float(self.threshold_entry_center.get())
         self.mtf_threshold_surround = float(self.threshold_entry_surround.get())
         self.mtf_delta_threshold = float(self.threshold_entry_delta.get())
+        self.read_gate_entries()
 
-        if self.current_frame is not None:
+        if label_idx in self.running_tests:
+            print(f"Test for {ANGLES[label_idx]} is still running, click ignored.")
+        elif self.roi_list and set(self.roi_field_labels) - {label[len("ROI_"):] for _, label in self.roi_list}:
+            self.ui_dispatcher.post_config(f'status_{label_idx}', text="Incomplete ROI set", foreground="red")
+        elif self.current_frame is not None and self.roi_list:
+            self.running_tests.add(label_idx)
+            self.ui_dispatcher.post_config(f'status_{label_idx}', text="Testing...", foreground="black")
             self.test_counters[label_idx] += 1
-            self.test_counter_labels[label_idx].config(text=f"Count: {self.test_counters[label_idx]}")
-            frame_image = Image.fromarray(self.current_frame)
-            mtf_values = []
-            min_mtf = float('inf')
-            max_mtf = 0
-            for idx, (roi, label) in enumerate(self.roi_list):
-                sfr = SFR(frame_image, roi)
-                results = sfr.calculate()
-                mtf50 = results['MTF50']
-                mtf_values.append(mtf50)
-                roi_labels = ["MTF_UL", "MTF_UR", "MTF_LL", "MTF_LR", "MTF_C"]
-                color = "red" if mtf50 < self.mtf_threshold_surround and label != "ROI_C" else "black"
-                color = "red" if label == "ROI_C" and mtf50 < self.mtf_threshold_center else color
-                self.roi_mtf_labels[label_idx][idx].config(text=f'{roi_labels[idx]}={mtf50:.2f}', foreground=color)
-            self.mtf_results[label_idx] = mtf_values
-            corner_diff = max(mtf_values[:-1]) - min(mtf_values[:-1])
-            delta_pass = corner_diff <= self.mtf_delta_threshold
-            overall_status = "Pass" if all(m >= self.mtf_threshold_surround for m in mtf_values[:-1]) and mtf_values[-1] >= self.mtf_threshold_center and delta_pass else "Fail"
-            color = "red" if not delta_pass else "black"
-            self.roi_diff_labels[label_idx].config(text=f'Diff={corner_diff:.2f}', foreground=color)
-            self.roi_status_labels[label_idx].config(text=overall_status, foreground=("green" if overall_status == "Pass" else "red"))
+            self.ui_dispatcher.post_config(f'counter_{label_idx}', text=f"Count: {self.test_counters[label_idx]}")
+            thresholds = (self.mtf_threshold_center, self.mtf_threshold_surround, self.mtf_delta_threshold)
+            orientation = 'auto' if self.orientation_mode_var.get() else None
+            gate = None
+            if self.frame_gate_enabled:
+                gate = FrameQualityGate(self.frame_gate.min_edge_sharpness, self.frame_gate.min_contrast, self.frame_gate.max_frame_diff, self.frame_gate.max_clipped_ratio)
+            threading.Thread(target=self.run_mtf_test, args=(label_idx, list(self.roi_list), thresholds, self.test_counters[label_idx], orientation, self.roi_template_var.get(), gate, self.frame_gate_timeout), daemon=True).start()
         self.save_thresholds()
 
+    def wait_for_good_frame(self, rois, gate, timeout):
+        deadline = time.time() + timeout
+        last_frame = None
+        good_frame = None
+        reason = "no new frames"
+        while good_frame is None and time.time() < deadline:
+            frame = self.current_frame
+            if frame is not None and frame is not last_frame:
+                last_frame = frame
+                check = gate.check(frame, rois)
+                if check is None:
+                    good_frame = frame
+                elif check != 'reference':
+                    reason = check
+            else:
+                time.sleep(0.005)
+        self.frame_gate.merge_counters(gate)
+        self.ui_dispatcher.post_config('frame_gate', text=self.frame_gate.summary())
+        return good_frame, reason
+
+    def run_mtf_test(self, label_idx, *args):
+        try:
+            self.measure_angle(label_idx, *args)
+        except Exception as e:
+            print(f"MTF test for {ANGLES[label_idx]} failed: {e}")
+            self.clear_angle_result(label_idx, "Error")
+        finally:
+            self.running_tests.discard(label_idx)
+
+    def clear_angle_result(self, label_idx, status_text):
+        self.mtf_results[label_idx] = None
+        self.ui_dispatcher.post(f'field_map_{label_idx}', ((0.5, 0.5), ()))
+        self.ui_dispatcher.post_config(f'diff_{label_idx}', text="Diff=", foreground="black")
+        self.ui_dispatcher.post_config(f'status_{label_idx}', text=status_text, foreground="red")
+
+    def measure_angle(self, label_idx, roi_list, thresholds, test_count, orientation=None, template_name="5-field", gate=None, gate_timeout=3.0):
+        rois = [roi for roi, _ in roi_list]
+        if gate is None:
+            frame = self.current_frame
+        else:
+            frame, reason = self.wait_for_good_frame(rois, gate, gate_timeout)
+            if frame is None:
+                self.clear_angle_result(label_idx, f"No stable frame ({reason})")
+                return
+        results = SFR.calculate_batch(frame, rois, return_curves=True, orientation=orientation)
+        results['label'] = [label for _, label in roi_list]
+        results['template'] = template_name
+        roi_array = np.array(results['roi'], dtype=float)
+        results['x'] = (roi_array[:, 0] + roi_array[:, 2]) / 2 / frame.shape[1]
+        results['y'] = (roi_array[:, 1] + roi_array[:, 3]) / 2 / frame.shape[0]
+        template = ROI_GRID_TEMPLATES[template_name]
+        verdict = evaluate_mtf_results(results['label'], results['MTF50'], *thresholds, corner_labels=template_corner_labels(template))
+        record_name = f"{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}_angle{label_idx}_{test_count}"
+        results['evidence'] = self.evidence_archiver.submit(record_name, frame, results, verdict['result'])
+        self.mtf_results[label_idx] = results
+        fields = tuple(zip(results['x'].tolist(), results['y'].tolist(), results['MTF50'].tolist(), verdict['field_pass'].tolist()))
+        self.ui_dispatcher.post(f'field_map_{label_idx}', (template_grid_pitch(template), fields))
+        color = "red" if not verdict['delta_pass'] else "black"
+        diff_text = f"Diff={verdict['corner_diff']:.2f}"
+        if 'Astigmatism' in results and not np.isnan(results['Astigmatism']).all():
+            diff_text += f" Astig={np.nanmax(results['Astigmatism']):.2f}"
+        self.ui_dispatcher.post_config(f'diff_{label_idx}', text=diff_text, foreground=color)
+        self.ui_dispatcher.post_config(f'status_{label_idx}', text=verdict['result'], foreground=("green" if verdict['result'] == "Pass" else "red"))
+
+    def draw_field_map(self, label_idx, field_map):
+        (pitch_x, pitch_y), fields = field_map
+        canvas = self.field_map_canvases[label_idx]
+        canvas.delete("all")
+        width, height = self.FIELD_MAP_SIZE
+        cell_w = min(pitch_x * 0.9, 0.25) * width
+        cell_h = min(pitch_y * 0.9, 0.25) * height
+        for x, y, mtf50, passed in fields:
+            level = int(min(max(mtf50, 0.0), 1.0) * 155) + 100
+            fill = f"#00{level:02x}00" if passed else f"#{level:02x}0000"
+            cx, cy = x * width, y * height
+            canvas.create_rectangle(cx - cell_w / 2, cy - cell_h / 2, cx + cell_w / 2, cy + cell_h / 2, fill=fill, outline="black")
+            canvas.create_text(cx, cy, text=f"{mtf50:.2f}", fill="white", font=("TkDefaultFont", 7))
+
     def enable_controls(self):
         self.wide_end_button.config(state=tk.NORMAL)
         self.middle_button.config(state=tk.NORMAL)
@@ -578,9 +864,9 @@ class MTFApplication:
         self.capture_button.config(state=tk.NORMAL)
         self.clear_button.config(state=tk.NORMAL)
         self.export_button.config(state=tk.NORMAL)
-        for idx, angle in enumerate(self.roi_mtf_labels):
-            for label in angle:
-                label.config(state=tk.NORMAL)
+        self.apply_template_button.config(state=tk.NORMAL)
+        for canvas in self.field_map_canvases:
+            canvas.config(state=tk.NORMAL)
 
     def disable_controls(self):
         self.wide_end_button.config(state=tk.DISABLED)
@@ -589,9 +875,9 @@ class MTFApplication:
         self.autofocus_button.config(state=tk.DISABLED)
         self.capture_button.config(state=tk.DISABLED)
         self.clear_button.config(state=tk.DISABLED)
-        for idx, angle in enumerate(self.roi_mtf_labels):
-            for label in angle:
-                label.config(state=tk.DISABLED)
+        self.apply_template_button.config(state=tk.DISABLED)
+        for canvas in self.field_map_canvases:
+            canvas.config(state=tk.DISABLED)
 
     def toggle_engineer_mode(self):
         engineer_password = self.engineer_password_entry.get()
@@ -603,6 +889,9 @@ class MTFApplication:
                 self.threshold_entry_center.config(state='normal')
                 self.threshold_entry_surround.config(state='normal')
                 self.threshold_entry_delta.config(state='normal')
+                self.frame_gate_checkbutton.config(state='normal')
+                for _, entry in self.gate_entries:
+                    entry.config(state='normal')
                 print("Entered Engineer Mode")
             else:
                 self.engineer_mode = False
@@ -611,6 +900,9 @@ class MTFApplication:
                 self.threshold_entry_center.config(state='disabled')
                 self.threshold_entry_surround.config(state='disabled')
                 self.threshold_entry_delta.config(state='disabled')
+                self.frame_gate_checkbutton.config(state='disabled')
+                for _, entry in self.gate_entries:
+                    entry.config(state='disabled')
                 print("Exited Engineer Mode")
         else:
             print("Incorrect Engineer Credentials")
@@ -619,38 +911,41 @@ class MTFApplication:
         now = datetime.datetime.now()
         formatted_time = now.strftime("%Y%m%d%H%M")
         data = {
-            'Angle': ['0°', '45° - Face 1', '45° - Face 2', '45° - Face 3', '45° - Face 4'],
+            'Angle': ANGLES,
             'Count': self.test_counters,
             'Result': [],
             'Corner_diff': [],
             'Center_TH': [self.mtf_threshold_center] * 5,
             'Corner_TH': [self.mtf_threshold_surround] * 5,
             'Corner_diff_TH': [self.mtf_delta_threshold] * 5,
+            'Evidence': [results['evidence'] if results is not None else None for results in self.mtf_results],
         }
-        mtf_labels = ['MTF_UL', 'MTF_UR', 'MTF_LL', 'MTF_LR', 'MTF_C']
-        
-        for label in mtf_labels:
-            data[label] = []
-
-        for i in range(5):
-            if i < len(self.mtf_results) and len(self.mtf_results[i]) == 5:
-                mtf_values = self.mtf_results[i]
-                min_mtf = min(mtf_values[:-1])
-                max_mtf = max(mtf_values[:-1])
-                corner_diff = max_mtf - min_mtf
-                data['Corner_diff'].append(corner_diff)
-                center_pass = mtf_values[-1] >= self.mtf_threshold_center
-                surround_pass = all(m >= self.mtf_threshold_surround for m in mtf_values[:-1])
-                delta_pass = corner_diff <= self.mtf_delta_threshold
-                result = "Pass" if center_pass and surround_pass and delta_pass else "Fail"
-                data['Result'].append(result)
+        orientation_columns = {'MTF50_S': '_S', 'MTF50_T': '_T', 'Astigmatism': '_Astig'}
+        mtf_labels = []
+        angle_values = []
+        for results in self.mtf_results:
+            mtf_values = {}
+            if results is not None:
+                corner_labels = template_corner_labels(ROI_GRID_TEMPLATES[results['template']])
+                verdict = evaluate_mtf_results(results['label'], results['MTF50'], self.mtf_threshold_center, self.mtf_threshold_surround, self.mtf_delta_threshold, corner_labels)
+                data['Corner_diff'].append(verdict['corner_diff'])
+                data['Result'].append(verdict['result'])
+                for idx, label in enumerate(results['label']):
+                    column = label.replace("ROI_", "MTF_", 1)
+                    mtf_values[column] = float(results['MTF50'][idx])
+                    for key, suffix in orientation_columns.items():
+                        if key in results:
+                            mtf_values[column + suffix] = float(results[key][idx])
             else:
-                mtf_values = [None] * 5
                 data['Corner_diff'].append(None)
                 data['Result'].append("Fail")
-            
-            for j, label in enumerate(mtf_labels):
-                data[label].append(mtf_values[j])
+            for column in mtf_values:
+                if column not in mtf_labels:
+                    mtf_labels.append(column)
+            angle_values.append(mtf_values)
+
+        for label in mtf_labels:
+            data[label] = [mtf_values.get(label) for mtf_values in angle_values]
 
         df = pd.DataFrame(data)
         file_path = filedialog.asksaveasfilename(initialfile=f"MTFTestResults_{formatted_time}", defaultextension='.xlsx', filetypes=[("Excel files", "*.xlsx")])
@@ -662,10 +957,183 @@ class MTFApplication:
         self.mtf_threshold_center = float(self.threshold_entry_center.get())
         self.mtf_threshold_surround = float(self.threshold_entry_surround.get())
         self.mtf_delta_threshold = float(self.threshold_entry_delta.get())
+        self.read_gate_entries()
         self.save_thresholds()
+        self.evidence_archiver.close()
         self.master.destroy()
 
+
+class FrameQualityGate:
+    """Cheap checks on the ROI pixels of a frame before an SFR is spent on it.
+
+    A frame is rejected when any ROI is too soft, still moving relative to the
+    previous checked frame (mean absolute difference) or has too many clipped
+    pixels. Softness is the 99th percentile gradient divided by the crop's
+    p95-p5 contrast, so it tracks edge blur independently of chart contrast and
+    sensor noise (about 0.4 for a sharp edge, 0.13 at a 3 px Gaussian blur);
+    ROIs below min_contrast hold no edge and skip the blur check. The first
+    frame only becomes the reference.
+    """
+
+    def __init__(self, min_edge_sharpness=0.12, min_contrast=25, max_frame_diff=6.0, max_clipped_ratio=0.05):
+        self.min_edge_sharpness = min_edge_sharpness
+        self.min_contrast = min_contrast
+        self.max_frame_diff = max_frame_diff
+        self.max_clipped_ratio = max_clipped_ratio
+        self.previous_crops = None
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = {'blur': 0, 'motion': 0, 'clipping': 0}
+
+    def check(self, frame, rois):
+        crops = []
+        for roi in rois:
+            x1, y1, x2, y2 = (max(int(v), 0) for v in SFR(None, roi).image_roi)
+            crops.append(SFR.to_grayscale(np.ascontiguousarray(frame[y1:y2, x1:x2])))
+        previous_crops, self.previous_crops = self.previous_crops, crops
+        reason = None
+        for idx, crop in enumerate(crops):
+            if crop.size == 0:
+                continue
+            if np.count_nonzero((crop == 0) | (crop == 255)) > self.max_clipped_ratio * crop.size:
+                reason = 'clipping'
+            elif self._is_blurred(crop):
+                reason = 'blur'
+            elif previous_crops is not None and np.abs(crop.astype(np.int16) - previous_crops[idx]).mean() > self.max_frame_diff:
+                reason = 'motion'
+            if reason:
+                break
+        if reason is None and previous_crops is None:
+            return 'reference'
+        with self.lock:
+            if reason is None:
+                self.accepted += 1
+            else:
+                self.rejected[reason] += 1
+        return reason
+
+    def _is_blurred(self, crop):
+        low, high = np.percentile(crop, (5, 95))
+        if high - low < self.min_contrast:
+            return False
+        grad_y, grad_x = np.gradient(crop.astype(np.float32))
+        return np.percentile(np.hypot(grad_x, grad_y), 99) / (high - low) < self.min_edge_sharpness
+
+    def merge_counters(self, other):
+        with self.lock:
+            self.accepted += other.accepted
+            for reason, count in other.rejected.items():
+                self.rejected[reason] += count
+
+    def summary(self):
+        with self.lock:
+            rejected = dict(self.rejected)
+        return f"Rejected frames: blur {rejected['blur']} / motion {rejected['motion']} / clip {rejected['clipping']}"
+
+
+class EvidenceArchiver:
+    """Writes raw ROI crops and SFR curves of each test to compressed .npz files.
+
+    Files are written by a background thread from a bounded queue; when the
+    queue is full the record is dropped rather than stalling the caller. The
+    oldest archives are deleted once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, queue_size=64):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.files = []
+        self.total_bytes = 0
+        self.writer_thread = threading.Thread(target=self._run, daemon=True)
+        self.writer_thread.start()
+
+    def submit(self, record_name, frame, results, verdict):
+        arrays = {
+            'label': np.array(results['label']),
+            'roi': np.array(results['roi']),
+            'MTF50': np.asarray(results['MTF50']),
+            'MTF50P': np.asarray(results['MTF50P']),
+            'verdict': np.array(verdict),
+        }
+        for key in ('MTF50_V', 'MTF50_H', 'MTF50_S', 'MTF50_T', 'Astigmatism'):
+            if key in results:
+                arrays[key] = np.asarray(results[key])
+        for idx, (x1, y1, x2, y2) in enumerate(results['roi']):
+            arrays[f'crop_{idx}'] = frame[max(y1, 0):y2, max(x1, 0):x2].copy()
+            for key in ('ESF', 'LSF', 'MTF'):
+                if key in results:
+                    arrays[f'{key.lower()}_{idx}'] = np.asarray(results[key][idx], dtype=np.float32)
+        path = os.path.join(self.directory, f"{record_name}.npz")
+        try:
+            self.queue.put_nowait((path, arrays))
+        except queue.Full:
+            self.dropped += 1
+            print(f"Evidence queue full, dropped {record_name} ({self.dropped} dropped)")
+            return None
+        return path
+
+    def close(self, timeout=5):
+        try:
+            self.queue.put((None, None), timeout=timeout)
+        except queue.Full:
+            return
+        self.writer_thread.join(timeout)
+
+    def _scan_existing(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                path = os.path.join(self.directory, name)
+                entries.append((os.path.getmtime(path), path, os.path.getsize(path)))
+        entries.sort()
+        self.files = [(path, size) for _, path, size in entries]
+        self.total_bytes = sum(size for _, size in self.files)
+
+    def _rotate(self):
+        while self.total_bytes > self.max_bytes and len(self.files) > 1:
+            path, size = self.files.pop(0)
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Could not remove old evidence {path}: {e}")
+            self.total_bytes -= size
+
+    def _run(self):
+        try:
+            self._scan_existing()
+        except OSError as e:
+            print(f"Could not scan evidence directory {self.directory}: {e}")
+        while True:
+            path, arrays = self.queue.get()
+            if path is None:
+                break
+            tmp_path = path + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as f:
+                    np.savez_compressed(f, **arrays)
+                os.replace(tmp_path, path)
+                size = os.path.getsize(path)
+                self.files.append((path, size))
+                self.total_bytes += size
+                self._rotate()
+            except Exception as e:
+                # One bad record must not stop the writer, or every later submit would queue up unwritten.
+                print(f"Could not write evidence {path}: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
 class SFR:
+    MIN_EDGE_LINES = 8
+    EDGE_CONTRAST_RATIO = 5.0
+    MAX_EDGE_SLOPE = 0.5
+    MAX_EDGE_RESIDUAL = 3.0
+    ORIENTATION_KEYS = ('MTF50_V', 'MTF50_H', 'MTF50_S', 'MTF50_T', 'Astigmatism')
+
     def __init__(self, image, image_roi, gamma=0.5, oversampling_rate=4):
         self.image = image
         self.image_roi = self._validate_roi(image_roi)
@@ -685,80 +1153,406 @@ class SFR:
             return {'MTF50': 0, 'MTF50P': 0}
         image = self.image.crop(self.image_roi).convert('L')
         image = image.transpose(Image.Transpose.ROTATE_90)
-        pixels = np.array(image)
-        esf, slope, intercept = self._get_esf_data(pixels, self.oversampling_rate)
+        return self._calculate_pixels(np.array(image))
+
+    @staticmethod
+    def to_grayscale(frame):
+        frame = np.asarray(frame)
+        if frame.ndim == 2:
+            return frame
+        return np.asarray(Image.fromarray(frame).convert('L'))
+
+    @classmethod
+    def calculate_batch(cls, frame, rois, gamma=0.5, oversampling_rate=4, return_curves=False, orientation=None):
+        """Measure all ROIs of one frame and return the results column-wise.
+
+        Each field converts only its own crop to grayscale, so the cost grows with
+        the ROI area and not with the frame size or the spread of the fields.
+        With return_curves the ESF/LSF/MTF arrays of each field are included as well.
+        With orientation='auto' each field is measured along every edge direction
+        it contains (see _calculate_orientations) and MTF50 is the worse of the two.
+        """
+        sfrs = [cls(None, roi, gamma, oversampling_rate) for roi in rois]
+        results = {
+            'roi': [sfr.image_roi for sfr in sfrs],
+            'MTF50': np.zeros(len(rois)),
+            'MTF50P': np.zeros(len(rois)),
+        }
+        if return_curves:
+            results.update({'ESF': [], 'LSF': [], 'MTF': []})
+        if orientation == 'auto':
+            results.update({key: np.full(len(rois), np.nan) for key in cls.ORIENTATION_KEYS})
+        frame = np.asarray(frame)
+        frame_cx, frame_cy = frame.shape[1] / 2, frame.shape[0] / 2
+        for idx, sfr in enumerate(sfrs):
+            x1, y1, x2, y2 = (max(int(v), 0) for v in sfr.image_roi)
+            crop = cls.to_grayscale(np.ascontiguousarray(frame[y1:y2, x1:x2]))
+            if orientation == 'auto':
+                field = sfr._calculate_orientations(crop, ((x1 + x2) / 2 - frame_cx, (y1 + y2) / 2 - frame_cy))
+                for key in cls.ORIENTATION_KEYS:
+                    results[key][idx] = field[key]
+            else:
+                field = sfr._calculate_pixels(np.rot90(crop))
+            results['MTF50'][idx] = field['MTF50']
+            results['MTF50P'][idx] = field['MTF50P']
+            if return_curves:
+                for key in ('ESF', 'LSF', 'MTF'):
+                    results[key].append(field[key])
+        return results
+
+    def _calculate_orientations(self, gray, radial_offset):
+        """Measure the vertical and/or horizontal edge of one ROI from a single grayscale crop.
+
+        The gradient arrays are computed once and used both to detect which edge
+        directions are present and to locate the edge on each line. A direction is
+        only measured when _is_edge confirms a straight edge; fields without any
+        confirmed edge report MTF50 = 0. An edge whose
+        line runs perpendicular to the radius from the frame center gives the
+        tangential MTF, one running along the radius the sagittal MTF.
+        """
+        pixels = np.asarray(gray, dtype=np.int32)
+        field = {key: np.nan for key in self.ORIENTATION_KEYS}
+        if pixels.shape[0] < 2 or pixels.shape[1] < 2:
+            field.update(self._calculate_pixels(pixels))
+            return field
+        grad_x = np.abs(np.diff(pixels, axis=1))
+        grad_y = np.abs(np.diff(pixels, axis=0))
+        measured = {}
+        rows = self._edge_lines(grad_x.max(axis=1))
+        if self._is_edge(grad_x[rows]):
+            measured['V'] = self._calculate_pixels(pixels[rows], grad_x[rows])
+        cols = self._edge_lines(grad_y.max(axis=0))
+        if self._is_edge(np.rot90(grad_y[:, cols])):
+            measured['H'] = self._calculate_pixels(np.rot90(pixels[:, cols]), np.rot90(grad_y[:, cols]))
+        if not measured:
+            field.update({'MTF50': 0, 'MTF50P': 0, 'ESF': np.zeros(0), 'LSF': np.zeros(0), 'MTF': np.zeros(0)})
+            return field
+        for direction, result in measured.items():
+            field[f'MTF50_{direction}'] = result['MTF50']
+        radial_x, radial_y = radial_offset
+        tangential, sagittal = ('V', 'H') if abs(radial_x) >= abs(radial_y) else ('H', 'V')
+        field['MTF50_T'] = field[f'MTF50_{tangential}']
+        field['MTF50_S'] = field[f'MTF50_{sagittal}']
+        if len(measured) == 2:
+            field['Astigmatism'] = abs(field['MTF50_V'] - field['MTF50_H'])
+        worst = min(measured.values(), key=lambda result: result['MTF50'])
+        field.update(worst)
+        return field
+
+    def _is_edge(self, line_diff):
+        """Check that the per-line gradient peaks form one straight, near-aligned edge above the noise."""
+        if line_diff.shape[0] < self.MIN_EDGE_LINES or line_diff.shape[1] < 2:
+            return False
+        peaks = line_diff.max(axis=1)
+        if np.median(peaks) < self.EDGE_CONTRAST_RATIO * max(np.median(line_diff), 1):
+            return False
+        lines = np.arange(line_diff.shape[0])
+        positions = line_diff.argmax(axis=1)
+        slope, intercept = np.polyfit(lines, positions, 1)
+        residual = positions - (slope * lines + intercept)
+        return abs(slope) <= self.MAX_EDGE_SLOPE and residual.std() <= self.MAX_EDGE_RESIDUAL
+
+    @staticmethod
+    def _edge_lines(line_strength):
+        strong = np.concatenate(([False], line_strength >= 0.5 * line_strength.max(), [False]))
+        changes = np.flatnonzero(np.diff(strong.astype(np.int8)))
+        starts, ends = changes[::2], changes[1::2]
+        longest = np.argmax(ends - starts)
+        return slice(starts[longest], ends[longest])
+
+    def _calculate_pixels(self, pixels, line_diff=None):
+        if pixels.shape[0] < 2 or pixels.shape[1] < 2:
+            return {'MTF50': 0, 'MTF50P': 0, 'ESF': np.zeros(0), 'LSF': np.zeros(0), 'MTF': np.zeros(0)}
+        esf, slope, intercept = self._get_esf_data(pixels, self.oversampling_rate, line_diff)
         lsf = self._get_lsf_data(esf)
         sfr = self._get_sfr_data(lsf)
         mtf, mtf50, mtf50p = self._get_mtf_data(sfr, self.oversampling_rate)
-        return {'MTF50': mtf50, 'MTF50P': mtf50p}
-
-    def _get_esf_data(self, pixel_array, oversampling_rate):
-        edge_idx_per_line = []
-        for line in pixel_array:
-            max_diff = 0
-            last_px = line[0]
-            max_idx = idx = 0
-            for px in line:
-                diff = abs(int(last_px) - int(px))
-                if diff > max_diff:
-                    max_diff = diff
-                    max_idx = idx
-                last_px = px
-                idx += 1
-            edge_idx_per_line.append(max_idx)
-        slope, intercept, _, _, _ = stats.linregress(list(range(len(edge_idx_per_line))), edge_idx_per_line)
-        inspection_width = 1
-        while inspection_width <= len(pixel_array[0]):
-            inspection_width *= 2
-        inspection_width //= 2
+        return {'MTF50': mtf50, 'MTF50P': mtf50p, 'ESF': esf, 'LSF': lsf, 'MTF': mtf}
+
+    def _get_esf_data(self, pixel_array, oversampling_rate, line_diff=None):
+        pixels = np.asarray(pixel_array, dtype=np.int32)
+        if line_diff is None:
+            line_diff = np.abs(np.diff(pixels, axis=1))
+        edge_idx_per_line = np.where(line_diff.max(axis=1) > 0, line_diff.argmax(axis=1) + 1, 0)
+        slope, intercept, _, _, _ = stats.linregress(np.arange(len(edge_idx_per_line)), edge_idx_per_line)
+        inspection_width = 1 << (pixels.shape[1].bit_length() - 1)
         half_inspection_width = inspection_width / 2
-        esf_sum = [0] * (inspection_width * oversampling_rate + 2)
-        hit_count = [0] * (inspection_width * oversampling_rate + 2)
-        x = y = 0
-        for line in pixel_array:
-            for px in line:
-                if abs(x - (y * slope + intercept)) <= half_inspection_width + 1 / oversampling_rate:
-                    idx = int((x - (y * slope + intercept) + half_inspection_width) * oversampling_rate + 1)
-                    esf_sum[idx] += px
-                    hit_count[idx] += 1
-                x += 1
-            y += 1
-            x = 0
-        hit_count = [1 if c == 0 else c for c in hit_count]
-        return np.divide(esf_sum, hit_count).tolist(), slope, intercept
+        bin_count = inspection_width * oversampling_rate + 2
+        y, x = np.indices(pixels.shape)
+        offset = x - (y * slope + intercept)
+        in_range = np.abs(offset) <= half_inspection_width + 1 / oversampling_rate
+        bin_idx = ((offset[in_range] + half_inspection_width) * oversampling_rate + 1).astype(np.int64)
+        bin_idx = np.minimum(bin_idx, bin_count - 1)
+        esf_sum = np.bincount(bin_idx, weights=pixels[in_range], minlength=bin_count)
+        hit_count = np.bincount(bin_idx, minlength=bin_count)
+        hit_count[hit_count == 0] = 1
+        return esf_sum / hit_count, slope, intercept
 
     def _get_lsf_data(self, esf_data):
-        lsf_data = [0] * (len(esf_data) - 2)
-        for idx in range(len(lsf_data)):
-            lsf_data[idx] = (esf_data[idx + 2] - esf_data[idx]) / 2
-        return lsf_data
+        esf_data = np.asarray(esf_data)
+        return (esf_data[2:] - esf_data[:-2]) / 2
 
     def _get_sfr_data(self, lsf_data):
-        hamming_window = np.hamming(len(lsf_data)).tolist()
-        windowed_lsf_data = np.multiply(lsf_data, hamming_window).tolist()
-        raw_sfr_data = np.abs(fft(windowed_lsf_data)).tolist()
-        sfr_base = raw_sfr_data[0]
-        return [d / sfr_base for d in raw_sfr_data]
+        windowed_lsf_data = np.multiply(lsf_data, np.hamming(len(lsf_data)))
+        raw_sfr_data = np.abs(fft(windowed_lsf_data))
+        return raw_sfr_data / raw_sfr_data[0]
 
     def _get_mtf_data(self, sfr_data, oversampling_rate):
-        mtf_data = [0] * int(len(sfr_data) / 2 / (oversampling_rate * 0.5))
+        bin_count = int(len(sfr_data) / 2 / (oversampling_rate * 0.5))
+        freq = np.arange(bin_count) / (bin_count - 1)
+        phase = np.pi * freq * 2 / oversampling_rate
+        correction = np.ones(bin_count)
+        np.divide(phase, np.sin(phase), out=correction, where=freq != 0)
+        mtf_data = np.asarray(sfr_data[:bin_count]) * correction
         mtf50 = 0
-        for idx in range(len(mtf_data)):
-            freq = idx / (len(mtf_data) - 1)
-            if freq == 0:
-                mtf_data[idx] = sfr_data[idx]
-            else:
-                mtf_data[idx] = sfr_data[idx] * (np.pi * freq * 2 / oversampling_rate) / np.sin(np.pi * freq * 2 / oversampling_rate)
-            if idx > 0 and mtf_data[idx] < 0.5 and mtf_data[idx - 1] >= 0.5:
-                mtf50 = (idx - 1 + (0.5 - mtf_data[idx]) / (mtf_data[idx - 1] - mtf_data[idx])) / (len(mtf_data) - 1)
-                break
+        crossings = np.flatnonzero((mtf_data[1:] < 0.5) & (mtf_data[:-1] >= 0.5)) + 1
+        if crossings.size:
+            idx = crossings[0]
+            mtf50 = (idx - 1 + (0.5 - mtf_data[idx]) / (mtf_data[idx - 1] - mtf_data[idx])) / (bin_count - 1)
         return mtf_data, mtf50, 0
 
+class ServiceBusy(Exception):
+    pass
+
+
+class ServiceTimeout(Exception):
+    pass
+
+
+def _warm_worker(_):
+    return os.getpid()
+
+
+def _parse_fields(payload):
+    template = [f"ROI_{label}" for label, _, _ in ROI_GRID_TEMPLATES[payload.get('template', "5-field")]]
+    fields = payload.get('rois') or []
+    if not isinstance(fields, list) or not fields:
+        raise ValueError("'rois' must be a non-empty list of [x1, y1, x2, y2]")
+    if len(fields) > len(template):
+        raise ValueError(f"Got {len(fields)} ROIs but the template has {len(template)} fields")
+    rois = []
+    labels = []
+    for idx, field in enumerate(fields):
+        label = template[idx]
+        if isinstance(field, dict):
+            # Labels decide which field is the center and which are corners, so only template labels are accepted.
+            label = str(field.get('label') or label)
+            if not label.startswith("ROI_"):
+                label = f"ROI_{label}"
+            if label not in template:
+                raise ValueError(f"Unknown label {field.get('label')!r}, expected one of {template}")
+            field = field.get('roi')
+        try:
+            roi = tuple(int(v) for v in field)
+        except (TypeError, ValueError):
+            raise ValueError(f"ROI {field!r} must be [x1, y1, x2, y2]")
+        if len(roi) != 4:
+            raise ValueError(f"ROI {field!r} must be [x1, y1, x2, y2]")
+        if label in labels:
+            raise ValueError(f"Label {label!r} is used more than once")
+        rois.append(roi)
+        labels.append(label)
+    return labels, rois
+
+
+def _measure_request(payload, rois):
+    if payload.get('image_path'):
+        frame = cv2.imread(payload['image_path'], cv2.IMREAD_COLOR)
+    elif payload.get('image'):
+        encoded = np.frombuffer(base64.b64decode(payload['image']), dtype=np.uint8)
+        frame = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    else:
+        raise ValueError("Request needs 'image_path' or base64 'image'")
+    if frame is None:
+        raise ValueError("Could not decode image")
+    height, width = frame.shape[:2]
+    for roi in rois:
+        x1, y1, x2, y2 = SFR(None, roi).image_roi
+        if x1 < 0 or y1 < 0 or x2 > width or y2 > height or x2 - x1 < 2 or y2 - y1 < 2:
+            raise ValueError(f"ROI {list(roi)} is empty or outside the {width}x{height} frame")
+    results = SFR.calculate_batch(frame, rois)
+    return results['roi'], results['MTF50'].tolist(), results['MTF50P'].tolist()
+
+
+class MTFService:
+    def __init__(self, host="127.0.0.1", port=8765, workers=None, max_pending=32, request_timeout=30, config_file='config.json', allow_threshold_override=False):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.config_file = config_file
+        self.allow_threshold_override = allow_threshold_override
+        self.mtf_threshold_center = 0.5
+        self.mtf_threshold_surround = 0.5
+        self.mtf_delta_threshold = 0.1
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.stats_lock = threading.Lock()
+        self.stats = {'served': 0, 'rejected': 0, 'failed': 0}
+        self.executor = None
+        self.load_thresholds()
+
+    def load_thresholds(self):
+        config = read_config(self.config_file)
+        if config is not None:
+            self.mtf_threshold_center = config['mtf_threshold_center']
+            self.mtf_threshold_surround = config['mtf_threshold_surround']
+            self.mtf_delta_threshold = config['mtf_delta_threshold']
+
+    def start_workers(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        # Spin every worker up front so the first requests do not pay process start and imports.
+        list(self.executor.map(_warm_worker, range(self.workers)))
+
+    def resolve_thresholds(self, overrides):
+        thresholds = {'center': self.mtf_threshold_center, 'surround': self.mtf_threshold_surround, 'delta': self.mtf_delta_threshold}
+        if not overrides:
+            return thresholds
+        if not self.allow_threshold_override:
+            raise ValueError("Per-request thresholds are disabled, start the service with --allow-threshold-override")
+        if not isinstance(overrides, dict):
+            raise ValueError("'thresholds' must be an object")
+        unknown = set(overrides) - set(thresholds)
+        if unknown:
+            raise ValueError(f"Unknown thresholds {sorted(unknown)}, expected {sorted(thresholds)}")
+        for key, value in overrides.items():
+            try:
+                thresholds[key] = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Threshold {key!r} must be a number, got {value!r}")
+        return thresholds
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def measure(self, payload):
+        if not isinstance(payload, dict):
+            raise ValueError("Request body must be a JSON object")
+        if payload.get('template', "5-field") not in ROI_GRID_TEMPLATES:
+            raise ValueError(f"Unknown template {payload['template']!r}, expected one of {list(ROI_GRID_TEMPLATES)}")
+        thresholds = self.resolve_thresholds(payload.get('thresholds'))
+        labels, rois = _parse_fields(payload)
+        if not self.pending.acquire(blocking=False):
+            self.count('rejected')
+            raise ServiceBusy()
+        try:
+            future = self.executor.submit(_measure_request, payload, rois)
+        except Exception:
+            self.pending.release()
+            raise
+        # The slot is held until the worker finishes, even if this client gives up waiting.
+        future.add_done_callback(lambda _: self.pending.release())
+        try:
+            rois, mtf50, mtf50p = future.result(timeout=self.request_timeout)
+        except FutureTimeoutError:
+            self.count('failed')
+            raise ServiceTimeout()
+        corner_labels = template_corner_labels(ROI_GRID_TEMPLATES[payload.get('template', "5-field")])
+        verdict = evaluate_mtf_results(labels, mtf50, thresholds['center'], thresholds['surround'], thresholds['delta'], corner_labels)
+        self.count('served')
+        return {
+            'fields': [
+                {'label': label, 'roi': list(roi), 'MTF50': m50, 'MTF50P': m50p, 'pass': bool(passed)}
+                for label, roi, m50, m50p, passed in zip(labels, rois, mtf50, mtf50p, verdict['field_pass'])
+            ],
+            'corner_diff': verdict['corner_diff'],
+            'delta_pass': bool(verdict['delta_pass']),
+            'result': verdict['result'],
+            'thresholds': thresholds,
+        }
+
+    def health(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats.update({'workers': self.workers, 'max_pending': self.max_pending})
+        return stats
+
+    def serve_forever(self):
+        self.start_workers()
+        server = MTFHTTPServer((self.host, self.port), MTFRequestHandler)
+        server.service = self
+        print(f"MTF service listening on http://{self.host}:{self.port} with {self.workers} workers")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.executor.shutdown(wait=False)
+
+
+class MTFHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class MTFRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, self.server.service.health())
+        else:
+            self.send_json(404, {'error': "Not found"})
+
+    def do_POST(self):
+        # Read the whole body before any reply so a keep-alive connection stays in step with the client.
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            self.close_connection = True
+            self.send_json(400, {'error': "Invalid Content-Length"}, {"Connection": "close"})
+            return
+        body = self.rfile.read(length)
+        if self.path != "/measure":
+            self.send_json(404, {'error': "Not found"})
+            return
+        service = self.server.service
+        try:
+            payload = json.loads(body)
+            self.send_json(200, service.measure(payload))
+        except ServiceBusy:
+            self.send_json(503, {'error': "Service busy"}, {"Retry-After": "1"})
+        except ServiceTimeout:
+            self.send_json(504, {'error': f"Measurement did not finish within {service.request_timeout} s"})
+        except (ValueError, KeyError, TypeError) as e:
+            service.count('failed')
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            service.count('failed')
+            self.send_json(500, {'error': str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+
 def main():
     set_start_method("spawn")
+    parser = argparse.ArgumentParser(description="MTF test interface")
+    parser.add_argument("--serve", action="store_true", help="run the HTTP measurement service instead of the GUI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--allow-threshold-override", action="store_true", help="let requests replace the config.json thresholds")
+    args = parser.parse_args()
+    if args.serve:
+        MTFService(args.host, args.port, args.workers, args.max_pending, allow_threshold_override=args.allow_threshold_override).serve_forever()
+        return
     root = tk.Tk()
     root.title("MTFTestInterface-v2.4")
-    root.geometry("1100x600")
+    root.geometry("1100x800")
     app = MTFApplication(root)
     root.mainloop()
 